@@ -6,43 +6,60 @@ Each folder becomes a manga title with images organized into chapters
 """
 
 import os
+import errno
 import shutil
 import argparse
-import re
 import math
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Set
 import sys
 
 
+# Lowercase image file extensions, without the leading dot
+_IMAGE_EXTENSIONS = frozenset(('jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'tiff', 'tif'))
+
+# os.fwalk and dir_fd-relative rmdir are only available on some platforms (POSIX)
+_USE_FWALK = hasattr(os, 'fwalk') and os.rmdir in os.supports_dir_fd
+
+# Maps characters that are invalid in Windows folder names to underscores
+_SAFE_TABLE = str.maketrans({c: '_' for c in '<>:"/\\|?*'})
+
+
 def get_safe_folder_name(name: str) -> str:
     """Sanitize folder names for filesystem compatibility"""
-    # Remove invalid characters for Windows filesystem
-    invalid_chars = r'[<>:"/\\|?*]'
-    safe_name = re.sub(invalid_chars, '_', name)
-    
-    # Remove leading/trailing spaces and dots
-    safe_name = safe_name.strip(' .')
-    
-    # Limit length to avoid path length issues
-    if len(safe_name) > 100:
-        safe_name = safe_name[:100]
-    
-    return safe_name
+    # Replace invalid characters for Windows filesystem, remove leading/trailing
+    # spaces and dots, and limit length to avoid path length issues
+    return name.translate(_SAFE_TABLE).strip(' .')[:100]
 
 
 def get_image_files(path: str) -> List[Path]:
     """Get all image files recursively from a directory"""
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.tif'}
-    
-    path_obj = Path(path)
     images = []
+    stack = [path]
     
-    for file_path in path_obj.rglob('*'):
-        if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-            images.append(file_path)
+    # Walk with os.scandir so file type checks come from the cached DirEntry
+    while stack:
+        # Skip unreadable folders, as Path.rglob did
+        try:
+            entries = os.scandir(stack.pop())
+        except PermissionError:
+            continue
+        
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = entry.name
+                    dot = name.rfind('.')
+                    if dot > 0 and name[dot + 1:].lower() in _IMAGE_EXTENSIONS:
+                        images.append((name, entry.path))
     
-    return sorted(images, key=lambda x: x.name)
+    # Sort on the cached name, then build Path objects once in final order
+    images.sort(key=itemgetter(0))
+    return [Path(image_path) for _, image_path in images]
 
 
 def format_chapter_name(chapter_number: int) -> str:
@@ -50,75 +67,183 @@ def format_chapter_name(chapter_number: int) -> str:
     return f"Chapter {chapter_number:03d}"
 
 
+def get_unique_file_name(name: str, used: Set[str]) -> str:
+    """Return a file name not yet in used (case-insensitively) and reserve it"""
+    new_name = name
+    
+    # Handle duplicate names
+    counter = 1
+    name_without_ext, extension = os.path.splitext(name)
+    while new_name.casefold() in used:
+        new_name = f"{name_without_ext}_{counter}{extension}"
+        counter += 1
+    
+    used.add(new_name.casefold())
+    return new_name
+
+
 def organize_images_into_chapters(manga_path: str, image_files: List[Path], 
-                                images_per_chapter: Optional[int], dry_run: bool) -> None:
+                                images_per_chapter: Optional[int], dry_run: bool,
+                                log: Optional[List[str]] = None) -> None:
     """Organize images into chapter folders"""
+    output = print if log is None else log.append
     total_images = len(image_files)
     
     # If images_per_chapter is None, put all images in Chapter 1
     if images_per_chapter is None:
-        total_chapters = 1
         images_per_chapter = total_images
-        print(f"    Total images: {total_images}")
-        print(f"    Will create 1 chapter with all {total_images} images")
+        output(f"    Total images: {total_images}")
+        output(f"    Will create 1 chapter with all {total_images} images")
     else:
         total_chapters = math.ceil(total_images / images_per_chapter)
-        print(f"    Total images: {total_images}")
-        print(f"    Will create {total_chapters} chapters ({images_per_chapter} images per chapter)")
+        output(f"    Total images: {total_images}")
+        output(f"    Will create {total_chapters} chapters ({images_per_chapter} images per chapter)")
     
-    for chapter_num in range(1, total_chapters + 1):
-        chapter_name = format_chapter_name(chapter_num)
-        chapter_path = Path(manga_path) / chapter_name
+    # Walk the images once, starting a new chapter every images_per_chapter images
+    for index, image in enumerate(image_files):
+        if index % images_per_chapter == 0:
+            chapter_name = format_chapter_name(index // images_per_chapter + 1)
+            chapter_path = os.path.join(manga_path, chapter_name)
+            chapter_size = min(images_per_chapter, total_images - index)
+            
+            output(f"    Creating {chapter_name} with {chapter_size} images")
+            
+            if not dry_run:
+                # Create chapter directory
+                os.makedirs(chapter_path, exist_ok=True)
+                
+                # Track names already in the chapter folder to avoid a stat per probe
+                used_names = {name.casefold() for name in os.listdir(chapter_path)}
         
-        start_index = (chapter_num - 1) * images_per_chapter
-        end_index = min(start_index + images_per_chapter, total_images)
-        chapter_images = image_files[start_index:end_index]
+        if dry_run:
+            continue
         
-        print(f"    Creating {chapter_name} with {len(chapter_images)} images")
+        # Move image to chapter folder
+        dest_path = os.path.join(chapter_path, get_unique_file_name(image.name, used_names))
         
-        if not dry_run:
-            # Create chapter directory
-            chapter_path.mkdir(parents=True, exist_ok=True)
-            
-            # Move images to chapter folder
-            for image in chapter_images:
-                dest_path = chapter_path / image.name
-                
-                # Handle duplicate names
-                counter = 1
-                original_name = image.name
-                while dest_path.exists():
-                    name_without_ext = Path(original_name).stem
-                    extension = Path(original_name).suffix
-                    new_name = f"{name_without_ext}_{counter}{extension}"
-                    dest_path = chapter_path / new_name
-                    counter += 1
-                
-                try:
-                    shutil.move(str(image), str(dest_path))
-                except Exception as e:
-                    print(f"      Error moving {image.name}: {e}")
+        # Images always live under the manga folder, so a plain rename suffices
+        try:
+            os.replace(image, dest_path)
+        except Exception as e:
+            output(f"      Error moving {image.name}: {e}")
+
 
+def _link_or_copy(src: str, dst: str) -> str:
+    """Hard link src to dst for backups, falling back to a full copy"""
+    # Images are only ever renamed afterwards, never rewritten, so a hard link
+    # is as good a snapshot as a copy and costs no extra disk space
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
 
-def remove_empty_directories(path: str) -> None:
+
+def remove_empty_directories(path: str, log: Optional[List[str]] = None) -> None:
     """Remove empty directories recursively"""
-    path_obj = Path(path)
+    output = print if log is None else log.append
+    
+    # Bottom-up walk visits children before their parents, so one pass is enough.
+    # Where supported, walk with directory file descriptors so each rmdir is
+    # resolved relative to its parent instead of re-traversing the full path.
+    if _USE_FWALK:
+        walker = os.fwalk(path, topdown=False)
+    else:
+        walker = ((root, dirs, files, None) for root, dirs, files in os.walk(path, topdown=False))
+    
+    for root, dirs, _, root_fd in walker:
+        for dir_name in dirs:
+            try:
+                if root_fd is None:
+                    os.rmdir(os.path.join(root, dir_name))
+                else:
+                    os.rmdir(dir_name, dir_fd=root_fd)
+                output(f"      Removed empty directory: {dir_name}")
+            except OSError as e:
+                # Non-empty directories (and symlinks to them) simply fail to be removed
+                if e.errno not in (errno.ENOTEMPTY, errno.EEXIST, errno.ENOTDIR):
+                    output(f"      Could not remove empty directory {dir_name}: {e}")
+
+
+def _process_one_manga(manga_dir: os.DirEntry, source_path_obj: Path, images_per_chapter: Optional[int],
+                       dry_run: bool, in_place: bool, log: List[str]) -> None:
+    """Organize a single manga directory, buffering its output in log"""
+    manga_title = get_safe_folder_name(manga_dir.name)
+    log.append(f"Processing manga: {manga_title}")
+    
+    # Get all image files in this manga directory
+    image_files = get_image_files(manga_dir.path)
+    
+    if not image_files:
+        log.append(f"  No image files found in {manga_title}, skipping...")
+        return
     
-    while True:
-        empty_dirs = []
-        for dir_path in path_obj.rglob('*'):
-            if dir_path.is_dir() and not any(dir_path.iterdir()):
-                empty_dirs.append(dir_path)
+    if in_place:
+        # Organize in the same directory
+        target_path = Path(manga_dir.path)
         
-        if not empty_dirs:
-            break
+        # Create backup of original structure if not dry run
+        if not dry_run:
+            backup_path = source_path_obj / "_Backup"
+            manga_backup_path = backup_path / manga_title
+            if not manga_backup_path.exists():
+                shutil.copytree(manga_dir.path, str(manga_backup_path),
+                                copy_function=_link_or_copy)
+                log.append("  Created backup of original structure")
+    else:
+        # Create organized version in new location
+        organized_path = source_path_obj / "Organized_Mihon"
+        target_path = organized_path / manga_title
+        
+        if not dry_run:
+            # Also creates Organized_Mihon itself on first use
+            target_path.mkdir(parents=True, exist_ok=True)
             
-        for dir_path in empty_dirs:
-            try:
-                dir_path.rmdir()
-                print(f"      Removed empty directory: {dir_path.name}")
-            except Exception as e:
-                print(f"      Could not remove empty directory {dir_path.name}: {e}")
+            used_names = {name.casefold() for name in os.listdir(target_path)}
+            target_was_empty = not used_names
+            
+            # Copy all images to target location first
+            copied = []
+            for image in image_files:
+                new_name = get_unique_file_name(image.name, used_names)
+                dest_path = target_path / new_name
+                
+                shutil.copy2(str(image), str(dest_path))
+                copied.append((new_name, dest_path))
+            
+            # A fresh target holds only the copies we just made, so skip the rescan;
+            # otherwise re-split everything already there along with the new copies
+            if target_was_empty:
+                copied.sort(key=itemgetter(0))
+                image_files = [dest_path for _, dest_path in copied]
+            else:
+                image_files = get_image_files(str(target_path))
+    
+    # Organize images into chapters
+    organize_images_into_chapters(str(target_path), image_files, images_per_chapter, dry_run, log)
+    
+    # Clean up empty directories after organization
+    if not dry_run and in_place:
+        remove_empty_directories(str(target_path), log)
+    
+    log.append(f"  Completed organizing {manga_title}\n")
+
+
+def _process_manga_group(manga_dirs: List[os.DirEntry], source_path_obj: Path,
+                         images_per_chapter: Optional[int], dry_run: bool,
+                         in_place: bool) -> Tuple[List[str], bool]:
+    """Organize manga directories that share a target title one after another"""
+    log = []
+    failed = False
+    
+    for manga_dir in manga_dirs:
+        try:
+            _process_one_manga(manga_dir, source_path_obj, images_per_chapter, dry_run, in_place, log)
+        except Exception as e:
+            log.append(f"  Error processing {manga_dir.name}: {e}\n")
+            failed = True
+    
+    return log, failed
 
 
 def organize_mihon_image_folders(source_path: str, images_per_chapter: Optional[int], 
@@ -138,8 +263,10 @@ def organize_mihon_image_folders(source_path: str, images_per_chapter: Optional[
     source_path_obj = Path(source_path)
     
     # Get all directories in source path (these will be manga titles)
-    manga_directories = [d for d in source_path_obj.iterdir() 
-                        if d.is_dir() and not re.match(r'^(Organized_Mihon|_Backup)$', d.name)]
+    # DirEntry.is_dir() answers from the cached directory listing where possible
+    with os.scandir(source_path) as entries:
+        manga_directories = [entry for entry in entries
+                             if entry.is_dir() and entry.name not in ('Organized_Mihon', '_Backup')]
     
     if not manga_directories:
         print("No manga directories found in source path.")
@@ -154,64 +281,30 @@ def organize_mihon_image_folders(source_path: str, images_per_chapter: Optional[
             backup_path.mkdir(parents=True, exist_ok=True)
             print(f"Created backup directory: {backup_path}")
     
+    # Folders whose names sanitize to the same title share an output folder,
+    # so they must be processed by the same worker, one after another
+    manga_groups = {}
     for manga_dir in manga_directories:
-        manga_title = get_safe_folder_name(manga_dir.name)
-        print(f"Processing manga: {manga_title}")
-        
-        # Get all image files in this manga directory
-        image_files = get_image_files(str(manga_dir))
-        
-        if not image_files:
-            print(f"  No image files found in {manga_title}, skipping...")
-            continue
-        
-        if in_place:
-            # Organize in the same directory
-            target_path = manga_dir
-            
-            # Create backup of original structure if not dry run
-            if not dry_run:
-                backup_path = source_path_obj / "_Backup"
-                manga_backup_path = backup_path / manga_title
-                if not manga_backup_path.exists():
-                    shutil.copytree(str(manga_dir), str(manga_backup_path))
-                    print("  Created backup of original structure")
-        else:
-            # Create organized version in new location
-            organized_path = source_path_obj / "Organized_Mihon"
-            target_path = organized_path / manga_title
-            
-            if not dry_run:
-                organized_path.mkdir(parents=True, exist_ok=True)
-                target_path.mkdir(parents=True, exist_ok=True)
-                
-                # Copy all images to target location first
-                for image in image_files:
-                    dest_path = target_path / image.name
-                    
-                    # Handle duplicate names
-                    counter = 1
-                    original_name = image.name
-                    while dest_path.exists():
-                        name_without_ext = Path(original_name).stem
-                        extension = Path(original_name).suffix
-                        new_name = f"{name_without_ext}_{counter}{extension}"
-                        dest_path = target_path / new_name
-                        counter += 1
-                    
-                    shutil.copy2(str(image), str(dest_path))
-                
-                # Get the copied images for organization
-                image_files = get_image_files(str(target_path))
-        
-        # Organize images into chapters
-        organize_images_into_chapters(str(target_path), image_files, images_per_chapter, dry_run)
-        
-        # Clean up empty directories after organization
-        if not dry_run and in_place:
-            remove_empty_directories(str(target_path))
+        manga_groups.setdefault(get_safe_folder_name(manga_dir.name), []).append(manga_dir)
+    
+    # Distinct titles are independent, so process them concurrently
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_process_manga_group, manga_dirs, source_path_obj,
+                                   images_per_chapter, dry_run, in_place)
+                   for manga_dirs in manga_groups.values()]
         
-        print(f"  Completed organizing {manga_title}\n")
+        # Write each title's log in one go, in submission order, so output from
+        # different titles never interleaves and stdout is not flushed once per line
+        failures = 0
+        for future in futures:
+            log, failed = future.result()
+            sys.stdout.write("\n".join(log) + "\n")
+            failures += failed
+    
+    if failures:
+        print(f"Error: {failures} manga title(s) could not be organized.")
+        sys.exit(1)
     
     print("Organization complete!")
     